@@ -1,8 +1,14 @@
 
+import math
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 
+try:
+    from numba import njit, prange
+except ImportError: #numba is optional, the numpy versions below are used without it
+    njit = None
+
 S = 100 #current price of the underlying security
 K = 110 #strike price of the option
 option = 1  #type of option: 1 for call, -1 for put
@@ -13,52 +19,117 @@ Nsteps = 500 #number of time steps for the simulation
 Nsim = 500 #number of simulated path for the price of the underlying security
 Nopti = 500 #for control variate method, time periods to obtain optimal coefficient for reduced volatility
 
+#Builds the paths of a geometric brownian motion from a (Nsteps,N) matrix of standard normal draws,
+#with all the time steps fused into a single cumsum in log-space followed by a single exp.
+#Paths are stored in the dtype of Z: float32 halves memory traffic and is enough for pricing,
+#use float64 when paths are needed for sensitivities
+
+def gbm_paths(S,r,sigma,dt,Z):
+    paths = np.empty((Z.shape[0]+1,Z.shape[1]), dtype=Z.dtype)
+    paths[0,:] = S
+    log_path = paths[1:,:]
+    mu = dt*(r-0.5*sigma**2)
+    vol = sigma*math.sqrt(dt)
+    np.multiply(Z, vol, out=log_path)
+    log_path += mu
+    np.cumsum(log_path, axis=0, out=log_path)
+    np.exp(log_path, out=log_path)
+    log_path *= S
+    return paths
+
+#Compiled kernels streaming one path at a time (parallelized over paths) and accumulating
+#only the sums needed for the price, so no (Nsteps+1,Nsim) array is ever allocated
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def anti_mean_nb(option,S,K,r,sigma,T,Nsteps,Nsim):
+        dt = T / Nsteps
+        mu = Nsteps*dt*(r-0.5*sigma**2)
+        vol = sigma*math.sqrt(dt)
+        Npairs = Nsim // 2
+        payoff_sum = 0.0
+        for j in prange(Npairs):
+            w = 0.0
+            for i in range(Nsteps):
+                w += np.random.standard_normal()
+            up = S * math.exp(mu + vol*w)
+            down = S * math.exp(mu - vol*w)
+            payoff_sum += max(option*(up-K), 0.0) + max(option*(down-K), 0.0)
+        return np.exp(-r*T) * payoff_sum / (2*Npairs)
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def terminal_sums_nb(option,S,K,r,sigma,T,Nsteps,Nsim):
+        dt = T / Nsteps
+        mu = Nsteps*dt*(r-0.5*sigma**2)
+        vol = sigma*math.sqrt(dt)
+        disc = math.exp(-r*T)
+        sum_x = 0.0
+        sum_y = 0.0
+        sum_xy = 0.0
+        for j in prange(Nsim):
+            w = 0.0
+            for i in range(Nsteps):
+                w += np.random.standard_normal()
+            x = S * math.exp(mu + vol*w)
+            y = max(option*(x-K), 0.0) * disc
+            sum_x += x
+            sum_y += y
+            sum_xy += x*y
+        return (sum_x, sum_y, sum_xy)
+
+    def con_mean_nb(option,S,K,r,sigma,T,Nsteps,Nsim,Nopti):
+        sum_x, sum_y, sum_xy = terminal_sums_nb(option,S,K,r,sigma,T,Nsteps,Nopti)
+        cov = (sum_xy - sum_x*sum_y/Nopti) / (Nopti-1)
+        var_z = S ** 2 * np.exp(2 * r * T) * (np.exp(T * sigma ** 2) - 1)
+        c = -cov/var_z
+        exp_z = S * np.exp(r*T)
+        sum_x, sum_y, _ = terminal_sums_nb(option,S,K,r,sigma,T,Nsteps,Nsim)
+        return sum_y/Nsim + c * (sum_x/Nsim - exp_z)
+
 #Generates possible paths for the price of the underlying security using antithetic variate method
+#(with keep_paths=False and numba available, only the price is computed and None is returned for the paths).
+#seed can be an int or a np.random.Generator to make the numpy simulation reproducible
 
-def paths_anti(option,S,r,sigma,T,Nsteps,Nsim):
+def paths_anti(option,S,r,sigma,T,Nsteps,Nsim,dtype=np.float32,keep_paths=True,seed=None):
     dt = T / Nsteps
-    paths = np.zeros((Nsteps+1,Nsim))
-    paths[0,:] = S
-    
-    for j in range(Nsim+1//2):
-        for i in range(Nsteps):
-            random = np.random.normal()
-            paths[i+1,j] = paths[i,j] * np.exp(dt*(r-0.5*sigma**2)+sigma*np.sqrt(dt)*random)
-            paths[i+1,-j] = paths[i,-j] * np.exp(dt*(r-0.5*sigma**2)-sigma*np.sqrt(dt)*random)
-    payoffs = np.maximum(option*(paths[-1,:]-K), 0)
+    Nsim += Nsim % 2 #antithetic pairs need an even number of paths
+    if not keep_paths and njit is not None:
+        return (None, anti_mean_nb(option,S,K,r,sigma,T,Nsteps,Nsim))
+    rng = np.random.default_rng(seed)
+
+    #draw half of the noise and pair each column with its negated copy
+    Z_half = rng.standard_normal((Nsteps,Nsim//2), dtype=dtype)
+    Z = np.concatenate([Z_half,-Z_half], axis=1)
+    paths = gbm_paths(S,r,sigma,dt,Z)
+    payoffs = np.maximum(option*(paths[-1,:]-K), 0).astype(np.float64)
     mean = np.exp(-r*T)*np.mean(payoffs)
     return (paths,mean)
 
 #Alternative generation of paths using control variate method (computing covariance between underlying and option price)
 
-def paths_con(option,S,r,sigma,T,Nsteps,Nsim,Nopti):
+def paths_con(option,S,r,sigma,T,Nsteps,Nsim,Nopti,dtype=np.float32,keep_paths=True,seed=None):
+    if not keep_paths and njit is not None:
+        return (None, con_mean_nb(option,S,K,r,sigma,T,Nsteps,Nsim,Nopti))
     dt = T / Nsteps
-    paths_1 = np.zeros((Nsteps+1,Nopti))
-    paths_1[0,:] = S
-    paths_2 = np.zeros((Nsteps+1,Nsim))
-    paths_2[0,:] = S
-    
-    for j in range(Nopti):
-        for i in range(Nsteps):
-            random = np.random.normal()
-            paths_1[i+1,j] = paths_1[i,j] * np.exp(dt*(r-0.5*sigma**2)+sigma*np.sqrt(dt)*random)
-    payoffs_1 = np.maximum(option*(paths_1[-1,:]-K), 0)
-    cov = np.cov(paths_1,payoffs_1)[1,0]
+    rng = np.random.default_rng(seed)
+    paths_1 = gbm_paths(S,r,sigma,dt,rng.standard_normal((Nsteps,Nopti), dtype=dtype))
+    payoffs_1 = np.maximum(option*(paths_1[-1,:]-K), 0).astype(np.float64) * np.exp(-r*T)
+    cov = np.cov(paths_1[-1,:].astype(np.float64), payoffs_1, ddof=1)[0,1] #terminal price vs discounted payoff
     var_z = S ** 2 * np.exp(2 * r * T) * (np.exp(T * sigma ** 2) - 1)
     c = -cov/var_z
     exp_z = S * np.exp(r*T)
     
-    for j in range(Nsim):
-        for i in range(Nsteps):
-            random = np.random.normal()
-            paths_2[i+1,j] = paths_2[i,j] * np.exp(dt*(r-0.5*sigma**2)+sigma*np.sqrt(dt)*random)
+    paths_2 = gbm_paths(S,r,sigma,dt,rng.standard_normal((Nsteps,Nsim), dtype=dtype))
     
-    payoffs_2 = np.maximum(option*(paths_2[-1,:]-K), 0) * np.exp(-r*T)
-    mean = np.mean(payoffs_2 + c * (S - exp_z))
+    payoffs_2 = np.maximum(option*(paths_2[-1,:]-K), 0).astype(np.float64) * np.exp(-r*T)
+    mean = np.mean(payoffs_2 + c * (paths_2[-1,:].astype(np.float64) - exp_z))
     return (paths_2, mean)
 
+paths_a, mean_a = paths_anti(option,S,r,sigma,T,Nsteps,Nsim)
+paths_c, mean_c = paths_con(option,S,r,sigma,T,Nsteps,Nsim,Nopti)
+
 plt.figure()
-plt.plot(paths_anti(option,S,r,sigma,T,Nsteps,Nsim)[0], color='green',linewidth=0.2)
+plt.plot(paths_a, color='green',linewidth=0.2)
 plt.title("Antithetic variate method")
 plt.xlabel("Time")
 plt.ylabel("Value of the underlying security")
@@ -66,15 +137,15 @@ plt.figure()
 plt.title("Control variate method")
 plt.xlabel("Time")
 plt.ylabel("Value of the underlying security")
-plt.plot(paths_con(option,S,r,sigma,T,Nsteps,Nsim,Nopti)[0], color='red', linewidth=0.2)
+plt.plot(paths_c, color='red', linewidth=0.2)
 
 #if does not look log normal, increase Nsim
 plt.figure()    
-plt.hist(paths_anti(option,S,r,sigma,T,Nsteps,Nsim)[0][:,-1])
+plt.hist(paths_a[-1,:])
 plt.title("Distribution of underlying price at maturity (AVM)")
 plt.figure()
 plt.title("Distribution of underlying price at maturity (CVM)")
-plt.hist(paths_con(option,S,r,sigma,T,Nsteps,Nsim,Nopti)[0][:,-1])
+plt.hist(paths_c[-1,:])
 
 
-print("Prix anti:",paths_anti(option,S,r,sigma,T,Nsteps,Nsim)[1],"\n Prix con:", paths_con(option,S,r,sigma,T,Nsteps,Nsim,Nopti)[1])
\ No newline at end of file
+print("Prix anti:",mean_a,"\n Prix con:", mean_c)
\ No newline at end of file